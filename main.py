@@ -1,6 +1,127 @@
 import streamlit as st
+import hashlib
 import json
-from typing import Dict, List, Optional
+import os
+import pickle
+import re
+from array import array
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+try:
+    import orjson  # необязательная зависимость: ускоряет разбор JSON базы знаний
+except ImportError:
+    orjson = None
+
+
+SEARCH_PAGE_SIZE = 25
+
+_FIELD_SEP = "\x00"
+
+# Атрибуты TreatmentPlanner, которые строит _build_search_index и которые сохраняются в файл-кэш.
+# Версию нужно менять при любом изменении их формата — она входит в имя файла.
+_SEARCH_INDEX_VERSION = "2"
+_SEARCH_INDEX_ATTRS = (
+    "_stage_contexts", "_method_objs", "_method_haystacks", "_method_stage_idx",
+    "_method_is_joint", "_trigram_index",
+)
+
+
+@st.cache_data
+def _load_kb(path: str) -> Tuple[Dict, str]:
+    """Читает и разбирает JSON базы знаний один раз на процесс (общий кэш для всех сессий)
+
+    Вместе с данными возвращает хэш именно тех байтов, которые были разобраны.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    digest = hashlib.blake2b(data, digest_size=8).hexdigest()
+    if orjson is not None:
+        kb = orjson.loads(data)
+    else:
+        kb = json.loads(data.decode('utf-8'))
+    _normalize_kb(kb)
+    return kb, digest
+
+
+def _normalize_kb(kb: Dict):
+    """Приводит «surgical access» каждого метода к списку словарей, чтобы дальше не проверять его тип
+
+    Доступ, заданный простой строкой, становится {"name": ..., "_plain": True} и выводится без выделения, как раньше.
+    """
+    for disease in kb["disease"]:
+        for type_obj in disease.get("type", []):
+            for variant in type_obj.get("variant", []):
+                for stage in variant.get("stage", []):
+                    for group in stage.get("alternative_groups", []) + stage.get("joint_groups", []):
+                        for key in ["surgical methods", "rehabilitation methods", "medicines"]:
+                            for method in group.get(key, []):
+                                surgical_access = method.get("surgical access")
+                                if surgical_access is None:
+                                    continue
+                                if isinstance(surgical_access, str):
+                                    surgical_access = [surgical_access] if surgical_access else []
+                                elif not isinstance(surgical_access, list):
+                                    surgical_access = []
+                                method["surgical access"] = [
+                                    access if isinstance(access, dict) else {"name": str(access), "_plain": True}
+                                    for access in surgical_access
+                                ]
+
+
+@st.cache_resource
+def _load_search_index(kb_path: str, kb_digest: str, _planner: "TreatmentPlanner") -> Dict:
+    """Загружает поисковый индекс один раз на процесс: из файла-кэша рядом с JSON или строит и сохраняет его"""
+    index_path = f"{os.path.splitext(kb_path)[0]}.{kb_digest}.v{_SEARCH_INDEX_VERSION}.pkl"
+
+    try:
+        with open(index_path, 'rb') as f:
+            state = pickle.load(f)
+        if isinstance(state, dict) and set(state) == set(_SEARCH_INDEX_ATTRS):
+            return state
+    except Exception:
+        # Файл-кэш только ускоряет загрузку: если его нет или он не читается по любой причине — перестраиваем
+        pass
+
+    _planner._build_search_index()
+    state = {name: getattr(_planner, name) for name in _SEARCH_INDEX_ATTRS}
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, index_path)
+    except OSError:
+        # Каталог может быть недоступен для записи — тогда просто работаем без кэша
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+    else:
+        _remove_stale_search_indexes(kb_path, index_path)
+    return state
+
+
+def _remove_stale_search_indexes(kb_path: str, index_path: str):
+    """Удаляет файлы-кэши индекса от прежних версий этой базы знаний (каждый весит не меньше самого JSON)"""
+    kb_dir, kb_file = os.path.split(kb_path)
+    stale_re = re.compile(re.escape(os.path.splitext(kb_file)[0]) + r"\.[0-9a-f]{16}\.v[^.]+\.pkl")
+    try:
+        names = os.listdir(kb_dir or ".")
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(kb_dir, name)
+        if stale_re.fullmatch(name) and path != index_path:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+@st.cache_data(max_entries=256)
+def _search(kb_digest: str, keyword_lower: str, _planner: "TreatmentPlanner") -> List[int]:
+    """Кэширует номера найденных методов по содержимому базы знаний и запросу; планировщик не хэшируется"""
+    return _planner._search_index(keyword_lower)
 
 
 class TreatmentPlanner:
@@ -8,37 +129,100 @@ class TreatmentPlanner:
         if knowledge_base_path:
             self.load_knowledge_base(knowledge_base_path)
         else:
+            self.knowledge_base_path = None
+            self.knowledge_base_digest = None
             self.knowledge_base = {"disease": []}
+            self._build_indexes()
+            self._build_search_index()
 
     def load_knowledge_base(self, filepath: str):
-        with open(filepath, 'r', encoding='utf-8') as f:
-            self.knowledge_base = json.load(f)
+        self.knowledge_base_path = filepath
+        self.knowledge_base, self.knowledge_base_digest = _load_kb(filepath)
+        self._build_indexes()
+        # Индекс общий для всех сессий процесса и не изменяется после построения
+        self.__dict__.update(_load_search_index(filepath, self.knowledge_base_digest, self))
+
+    def _build_indexes(self):
+        """Строит словари для прямого доступа к заболеванию, типу и варианту по имени и сбрасывает кэши этапов"""
+        self._disease_by_name: Dict[str, Dict] = {}
+        self._type_by_name: Dict[Tuple[str, str], Dict] = {}
+        self._variant_by_name: Dict[Tuple[str, str, str], Dict] = {}
+        # Кэш методов этапа по id(stage); сам этап хранится рядом, чтобы не спутать с переиспользованным id
+        self._alt_methods_cache: Dict[int, Tuple[Dict, List[Dict]]] = {}
+        self._joint_methods_cache: Dict[int, Tuple[Dict, List[Dict]]] = {}
+        # setdefault сохраняет первое вхождение, как и прежний линейный поиск
+        for disease in self.knowledge_base["disease"]:
+            disease_name = disease["name"]
+            self._disease_by_name.setdefault(disease_name, disease)
+            for type_obj in disease.get("type", []):
+                type_name = type_obj["name"]
+                self._type_by_name.setdefault((disease_name, type_name), type_obj)
+                for variant in type_obj.get("variant", []):
+                    self._variant_by_name.setdefault((disease_name, type_name, variant["name"]), variant)
+        self._build_stats()
+
+    def _build_stats(self):
+        """Один раз считает статистику для раздела «База знаний»: по каждому типу и по каждому этапу"""
+        method_keys = ["surgical methods", "rehabilitation methods", "medicines"]
+        self._type_stats: Dict[int, Tuple[int, int, int, int]] = {}
+        self._stage_counts: Dict[int, Tuple[int, int]] = {}
+        for disease in self.knowledge_base["disease"]:
+            for type_obj in disease.get("type", []):
+                variants = type_obj.get("variant", [])
+                total_stages = 0
+                total_alt = 0
+                total_joint = 0
+                for v in variants:
+                    stages = v.get("stage", [])
+                    total_stages += len(stages)
+                    for s in stages:
+                        alt_count = sum(len(group.get(k, [])) for group in s.get("alternative_groups", []) for k in method_keys)
+                        joint_count = sum(len(group.get(k, [])) for group in s.get("joint_groups", []) for k in method_keys)
+                        self._stage_counts[id(s)] = (alt_count, joint_count)
+                        total_alt += alt_count
+                        total_joint += joint_count
+                self._type_stats[id(type_obj)] = (len(variants), total_stages, total_alt, total_joint)
+
+    def get_type_stats(self, type_obj: Dict) -> Tuple[int, int, int, int]:
+        """Возвращает (вариантов, этапов, альт. методов, совм. методов) для типа из базы знаний"""
+        return self._type_stats[id(type_obj)]
+
+    def get_stage_counts(self, stage: Dict) -> Tuple[int, int]:
+        """Возвращает (альт. методов, совм. методов) для этапа из базы знаний"""
+        return self._stage_counts[id(stage)]
 
     def get_diseases(self) -> List[str]:
         return [d["name"] for d in self.knowledge_base["disease"]]
 
     def get_types(self, disease_name: str) -> List[Dict]:
-        for d in self.knowledge_base["disease"]:
-            if d["name"] == disease_name:
-                return d.get("type", [])
-        return []
+        disease = self._disease_by_name.get(disease_name)
+        if not disease:
+            return []
+        return disease.get("type", [])
+
+    def get_type(self, disease_name: str, type_name: str) -> Optional[Dict]:
+        return self._type_by_name.get((disease_name, type_name))
 
     def get_variants(self, disease_name: str, type_name: str) -> List[Dict]:
-        types = self.get_types(disease_name)
-        for t in types:
-            if t["name"] == type_name:
-                return t.get("variant", [])
-        return []
+        type_obj = self.get_type(disease_name, type_name)
+        if not type_obj:
+            return []
+        return type_obj.get("variant", [])
+
+    def get_variant(self, disease_name: str, type_name: str, variant_name: str) -> Optional[Dict]:
+        return self._variant_by_name.get((disease_name, type_name, variant_name))
 
     def get_stages(self, disease_name: str, type_name: str, variant_name: str) -> List[Dict]:
-        variants = self.get_variants(disease_name, type_name)
-        variant = next((v for v in variants if v["name"] == variant_name), None)
+        variant = self.get_variant(disease_name, type_name, variant_name)
         if not variant:
             return []
         return variant.get("stage", [])
 
     def get_methods_from_alternative(self, stage: Dict) -> List[Dict]:
         """Извлекает все методы из списка alternative_groups, добавляя тип метода"""
+        cached = self._alt_methods_cache.get(id(stage))
+        if cached and cached[0] is stage:
+            return cached[1]
         methods = []
         for group in stage.get("alternative_groups", []):
             for method_type, key in [("хирургический", "surgical methods"),
@@ -49,10 +233,14 @@ class TreatmentPlanner:
                     item_copy = item.copy()
                     item_copy["method_type"] = method_type
                     methods.append(item_copy)
+        self._alt_methods_cache[id(stage)] = (stage, methods)
         return methods
 
     def get_methods_from_joint(self, stage: Dict) -> List[Dict]:
         """Извлекает все методы из списка joint_groups, добавляя тип метода и общую информацию группы"""
+        cached = self._joint_methods_cache.get(id(stage))
+        if cached and cached[0] is stage:
+            return cached[1]
         methods = []
         for group in stage.get("joint_groups", []):
             joint_indications = group.get("indications", [])
@@ -67,12 +255,11 @@ class TreatmentPlanner:
                     item_copy["joint_indications"] = joint_indications
                     item_copy["joint_recommendations"] = joint_recommendations
                     methods.append(item_copy)
+        self._joint_methods_cache[id(stage)] = (stage, methods)
         return methods
 
-    def search_methods_by_keyword(self, keyword: str) -> List[Dict]:
-        results = []
-        keyword_lower = keyword.lower()
-
+    def _iter_stages(self):
+        """Обходит всё дерево базы знаний и выдаёт каждый этап вместе с его контекстом"""
         for disease in self.knowledge_base["disease"]:
             disease_name = disease["name"]
             for type_obj in disease.get("type", []):
@@ -80,25 +267,73 @@ class TreatmentPlanner:
                 for variant in type_obj.get("variant", []):
                     variant_name = variant["name"]
                     for stage in variant.get("stage", []):
-                        stage_name = stage.get("name_stage", "")
-                        # Альтернативные методы
-                        for method in self.get_methods_from_alternative(stage):
-                            if self._method_matches(method, keyword_lower):
-                                results.append(self._format_result(
-                                    method, disease_name, type_name, variant_name,
-                                    stage_name, "alternative"
-                                ))
-                        # Совместные методы
-                        for method in self.get_methods_from_joint(stage):
-                            if self._method_matches(method, keyword_lower):
-                                results.append(self._format_result(
-                                    method, disease_name, type_name, variant_name,
-                                    stage_name, "joint"
-                                ))
-        return results
-
-    def _method_matches(self, method: Dict, keyword_lower: str) -> bool:
-        fields_to_check = [
+                        yield disease_name, type_name, variant_name, stage
+
+    def _build_search_index(self):
+        """Раскладывает методы по параллельным спискам и строит триграммный индекс для поиска
+
+        Метод i описывается элементами i списков _method_objs, _method_haystacks,
+        _method_stage_idx и _method_is_joint; контекст этапа хранится один раз в _stage_contexts.
+        """
+        self._stage_contexts: List[Tuple[str, str, str, str]] = []
+        self._method_objs: List[Dict] = []
+        # Текст всех полей метода в нижнем регистре, чтобы не приводить его заново при каждом поиске
+        self._method_haystacks: List[str] = []
+        self._method_stage_idx = array('I')
+        self._method_is_joint = array('B')
+        trigram_index: Dict[str, Set[int]] = defaultdict(set)
+        for disease_name, type_name, variant_name, stage in self._iter_stages():
+            stage_idx = len(self._stage_contexts)
+            self._stage_contexts.append((disease_name, type_name, variant_name, stage.get("name_stage", "")))
+            for is_joint, methods in ((0, self.get_methods_from_alternative(stage)),
+                                      (1, self.get_methods_from_joint(stage))):
+                for method in methods:
+                    idx = len(self._method_objs)
+                    haystack = self._method_haystack(method)
+                    self._method_objs.append(method)
+                    self._method_haystacks.append(haystack)
+                    self._method_stage_idx.append(stage_idx)
+                    self._method_is_joint.append(is_joint)
+                    for field in haystack.split(_FIELD_SEP):
+                        for i in range(len(field) - 2):
+                            trigram_index[field[i:i + 3]].add(idx)
+        self._trigram_index: Dict[str, Set[int]] = dict(trigram_index)
+
+    def _match(self, idx: int) -> Tuple[Dict, str, str, str, str, str]:
+        disease, type_name, variant, stage = self._stage_contexts[self._method_stage_idx[idx]]
+        method_category = "joint" if self._method_is_joint[idx] else "alternative"
+        return self._method_objs[idx], disease, type_name, variant, stage, method_category
+
+    def search_methods_by_keyword(self, keyword: str) -> List[Tuple[Dict, str, str, str, str, str]]:
+        """Возвращает найденные методы как кортежи (метод, заболевание, тип, вариант, этап, категория)
+
+        Словарь для отображения строится через format_result только для тех результатов, которые выводятся.
+        """
+        keyword_lower = keyword.lower()
+        if self.knowledge_base_path is None:
+            matches = self._search_index(keyword_lower)
+        else:
+            matches = _search(self.knowledge_base_digest, keyword_lower, self)
+        return [self._match(i) for i in matches]
+
+    def _search_index(self, keyword_lower: str) -> List[int]:
+        haystacks = self._method_haystacks
+
+        if len(keyword_lower) < 3:
+            matches = [i for i, hay in enumerate(haystacks) if keyword_lower in hay]
+        else:
+            # Кандидаты — методы, содержащие все триграммы запроса; подстроку проверяем ниже
+            postings = sorted(
+                (self._trigram_index.get(keyword_lower[i:i + 3], set()) for i in range(len(keyword_lower) - 2)),
+                key=len
+            )
+            candidates = sorted(postings[0].intersection(*postings[1:]))
+            matches = [i for i in candidates if keyword_lower in haystacks[i]]
+        return matches
+
+    @staticmethod
+    def _method_fields(method: Dict) -> List:
+        fields = [
             method.get("name method", ""),
             method.get("active substance", ""),
             method.get("recommendations", ""),
@@ -108,20 +343,18 @@ class TreatmentPlanner:
             *method.get("indications", []),
             *method.get("used material", []),
         ]
-        surgical_access = method.get("surgical access", [])
-        if isinstance(surgical_access, list):
-            for access in surgical_access:
-                if isinstance(access, dict):
-                    fields_to_check.append(str(access.get("name", "")))
-                    fields_to_check.extend(access.get("indications", []))
-                else:
-                    fields_to_check.append(str(access))
-        elif isinstance(surgical_access, str):
-            fields_to_check.append(surgical_access)
-        return any(keyword_lower in str(field).lower() for field in fields_to_check)
-
-    def _format_result(self, method: Dict, disease: str, type_name: str, variant: str,
-                       stage: str, method_category: str) -> Dict:
+        for access in method.get("surgical access", []):
+            fields.append(str(access.get("name", "")))
+            fields.extend(access.get("indications", []))
+        return fields
+
+    @staticmethod
+    def _method_haystack(method: Dict) -> str:
+        # Поля разделяются символом, которого нет в тексте, чтобы совпадение не склеивало соседние поля
+        return _FIELD_SEP.join(map(str, TreatmentPlanner._method_fields(method))).lower()
+
+    def format_result(self, method: Dict, disease: str, type_name: str, variant: str,
+                      stage: str, method_category: str) -> Dict:
         result = {
             "method_name": method.get("name method", method.get("active substance", "Без названия")),
             "disease": disease,
@@ -150,17 +383,11 @@ class TreatmentPlanner:
 
 
 def display_surgical_access(surgical_access):
-    if isinstance(surgical_access, list):
-        for access in surgical_access:
-            if isinstance(access, dict):
-                name = str(access.get('name', ''))
-                st.markdown(f"- **{name}**")
-                if access.get("indications"):
-                    st.write("  Показания: " + ", ".join(access["indications"]))
-            else:
-                st.markdown(f"- {access}")
-    elif isinstance(surgical_access, str):
-        st.markdown(f"- {surgical_access}")
+    for access in surgical_access:
+        name = str(access.get('name', ''))
+        st.markdown(f"- {name}" if access.get("_plain") else f"- **{name}**")
+        if access.get("indications"):
+            st.write("  Показания: " + ", ".join(access["indications"]))
 
 
 def display_method_details(method: Dict, is_joint: bool = False):
@@ -208,20 +435,15 @@ def display_method_details(method: Dict, is_joint: bool = False):
         st.write("**Доказательная база:** " + " | ".join(meta))
 
 
-def generate_treatment_report(stage: Dict, selected_type: Dict, variant_name: str) -> str:
+def generate_treatment_report(stage: Dict, selected_type: Dict, variant_name: str,
+                              planner: Optional[TreatmentPlanner] = None) -> str:
     def format_surgical_access(surgical_access):
         lines = []
-        if isinstance(surgical_access, list):
-            for access in surgical_access:
-                if isinstance(access, dict):
-                    name = str(access.get('name', ''))
-                    lines.append(f"- **{name}**")
-                    if access.get("indications"):
-                        lines.append("  Показания: " + ", ".join(access["indications"]))
-                else:
-                    lines.append(f"- {access}")
-        elif isinstance(surgical_access, str):
-            lines.append(f"- {surgical_access}")
+        for access in surgical_access:
+            name = str(access.get('name', ''))
+            lines.append(f"- {name}" if access.get("_plain") else f"- **{name}**")
+            if access.get("indications"):
+                lines.append("  Показания: " + ", ".join(access["indications"]))
         return "\n".join(lines)
 
     report_lines = []
@@ -232,7 +454,9 @@ def generate_treatment_report(stage: Dict, selected_type: Dict, variant_name: st
     report_lines.append(f"**Код МКБ-10:** {', '.join(selected_type.get('ICD-10_code', []))}")
     report_lines.append(f"**Этап:** {stage['name_stage']}\n")
 
-    alt_methods = TreatmentPlanner().get_methods_from_alternative(stage)  # используем статический контекст, не важно
+    # планировщик сессии уже хранит списки методов этапа; без него строим их заново
+    planner = planner or TreatmentPlanner()
+    alt_methods = planner.get_methods_from_alternative(stage)
     if alt_methods:
         report_lines.append("## Альтернативные методы")
         for method in alt_methods:
@@ -265,7 +489,7 @@ def generate_treatment_report(stage: Dict, selected_type: Dict, variant_name: st
             if method.get("evidence"):
                 report_lines.append(f"**Доказательность:** {method['evidence']}")
 
-    joint_methods = TreatmentPlanner().get_methods_from_joint(stage)
+    joint_methods = planner.get_methods_from_joint(stage)
     if joint_methods:
         report_lines.append("\n## Совместные методы")
         # Выводим общую информацию первой группы (если нужно)
@@ -310,25 +534,18 @@ def generate_treatment_report(stage: Dict, selected_type: Dict, variant_name: st
     return "\n".join(report_lines)
 
 
-def generate_treatment_report_html(stage: Dict, selected_type: Dict, variant_name: str) -> str:
+def generate_treatment_report_html(stage: Dict, selected_type: Dict, variant_name: str,
+                                   planner: Optional[TreatmentPlanner] = None) -> str:
     # аналогично generate_treatment_report, но с HTML
     def format_surgical_access_html(surgical_access):
-        if isinstance(surgical_access, list):
-            items = []
-            for access in surgical_access:
-                if isinstance(access, dict):
-                    name = str(access.get('name', ''))
-                    item = f"<li><b>{name}</b>"
-                    if access.get("indications"):
-                        item += "<ul><li>Показания: " + ", ".join(access["indications"]) + "</li></ul>"
-                    item += "</li>"
-                    items.append(item)
-                else:
-                    items.append(f"<li>{access}</li>")
-            return "<ul>" + "".join(items) + "</ul>"
-        elif isinstance(surgical_access, str):
-            return f"<ul><li>{surgical_access}</li></ul>"
-        return ""
+        items = []
+        for access in surgical_access:
+            name = str(access.get('name', ''))
+            items.append(f"<li>{name}" if access.get("_plain") else f"<li><b>{name}</b>")
+            if access.get("indications"):
+                items.append(f"<ul><li>Показания: {', '.join(access['indications'])}</li></ul>")
+            items.append("</li>")
+        return "<ul>" + "".join(items) + "</ul>"
 
     html_parts = []
     html_parts.append("<html><head><meta charset='utf-8'><title>План лечения</title>")
@@ -344,7 +561,7 @@ def generate_treatment_report_html(stage: Dict, selected_type: Dict, variant_nam
     html_parts.append(f"<b>Код МКБ-10:</b> {', '.join(selected_type.get('ICD-10_code', []))}<br>")
     html_parts.append(f"<b>Этап:</b> {stage['name_stage']}</p>")
 
-    planner = TreatmentPlanner()
+    planner = planner or TreatmentPlanner()
     alt_methods = planner.get_methods_from_alternative(stage)
     if alt_methods:
         html_parts.append("<h2>Альтернативные методы</h2>")
@@ -431,6 +648,10 @@ def generate_treatment_report_html(stage: Dict, selected_type: Dict, variant_nam
     return "\n".join(html_parts)
 
 
+def next_search_page():
+    st.session_state.search_page += 1
+
+
 def main():
     st.set_page_config(page_title="Клиническая рекомендация", page_icon="🏥", layout="wide")
 
@@ -454,7 +675,10 @@ def main():
     if app_mode == "Планирование лечения":
         st.header("Планирование лечения")
 
-        diseases = planner.get_diseases()
+        # Списки для выпадающих меню не меняются в течение сессии — строим их один раз
+        if 'diseases' not in st.session_state:
+            st.session_state.diseases = planner.get_diseases()
+        diseases = st.session_state.diseases
         if not diseases:
             st.error("База знаний не загружена или пуста. Проверьте путь к файлу.")
             return
@@ -464,17 +688,22 @@ def main():
             selected_disease = st.selectbox("Заболевание:", diseases)
 
         if selected_disease:
-            types = planner.get_types(selected_disease)
-            type_names = [t["name"] for t in types]
+            type_names_cache = st.session_state.setdefault('type_names', {})
+            if selected_disease not in type_names_cache:
+                type_names_cache[selected_disease] = [t["name"] for t in planner.get_types(selected_disease)]
+            type_names = type_names_cache[selected_disease]
             with col2:
                 selected_type_name = st.selectbox("Тип перелома:", type_names)
 
             if selected_type_name:
-                selected_type = next(t for t in types if t["name"] == selected_type_name)
+                selected_type = planner.get_type(selected_disease, selected_type_name)
                 st.info(f"**Код МКБ-10:** {', '.join(selected_type.get('ICD-10_code', []))}")
 
-                variants = planner.get_variants(selected_disease, selected_type_name)
-                variant_names = [v["name"] for v in variants]
+                variant_names_cache = st.session_state.setdefault('variant_names', {})
+                variant_key = (selected_disease, selected_type_name)
+                if variant_key not in variant_names_cache:
+                    variant_names_cache[variant_key] = [v["name"] for v in planner.get_variants(*variant_key)]
+                variant_names = variant_names_cache[variant_key]
                 with col3:
                     selected_variant_name = st.selectbox("Вариант (классификация):", variant_names)
 
@@ -525,8 +754,8 @@ def main():
                                     st.info("Совместные методы не указаны")
 
                                 if st.button(f"📄 Сгенерировать отчёт для этапа «{stage['name_stage']}»"):
-                                    report_md = generate_treatment_report(stage, selected_type, selected_variant_name)
-                                    report_html = generate_treatment_report_html(stage, selected_type, selected_variant_name)
+                                    report_md = generate_treatment_report(stage, selected_type, selected_variant_name, planner)
+                                    report_html = generate_treatment_report_html(stage, selected_type, selected_variant_name, planner)
 
                                     st.markdown("---")
                                     st.header("📄 Сгенерированный отчёт (Markdown)")
@@ -559,13 +788,24 @@ def main():
             placeholder="Например: остеосинтез, цефазолин, реабилитация..."
         )
 
-        if search_term:
+        if search_term and len(search_term) < 3:
+            # Запросы из одного-двух символов совпадают почти со всем — не ищем, пока ввод короткий
+            st.info("Введите не менее 3 символов для поиска")
+        elif search_term:
+            # Новый запрос — снова показываем только первую страницу
+            if st.session_state.get('search_query') != search_term:
+                st.session_state.search_query = search_term
+                st.session_state.search_page = 0
+
             results = planner.search_methods_by_keyword(search_term)
 
             if results:
                 st.write(f"Найдено результатов: {len(results)}")
 
-                for res in results:
+                shown = (st.session_state.search_page + 1) * SEARCH_PAGE_SIZE
+
+                for match in results[:shown]:
+                    res = planner.format_result(*match)
                     with st.expander(f"{res['method_name']} ({res['disease']} – {res['stage']})"):
                         st.write(f"**Заболевание:** {res['disease']}")
                         st.write(f"**Тип перелома:** {res['type']}")
@@ -611,6 +851,9 @@ def main():
                             st.write(f"**Убедительность:** {res['persuasiveness']}")
                         if res.get("evidence"):
                             st.write(f"**Доказательность:** {res['evidence']}")
+
+                if shown < len(results):
+                    st.button(f"Показать ещё (показано {shown} из {len(results)})", on_click=next_search_page)
             else:
                 st.warning("По вашему запросу ничего не найдено")
 
@@ -622,29 +865,12 @@ def main():
                 for type_obj in disease.get("type", []):
                     st.subheader(f"📄 {type_obj['name']} (МКБ-10: {', '.join(type_obj.get('ICD-10_code', []))})")
                     variants = type_obj.get("variant", [])
-                    st.write(f"**Вариантов:** {len(variants)}")
-
-                    total_stages = 0
-                    total_alt = 0
-                    total_joint = 0
-                    for v in variants:
-                        stages = v.get("stage", [])
-                        total_stages += len(stages)
-                        for s in stages:
-                            alt_groups = s.get("alternative_groups", [])
-                            for group in alt_groups:
-                                total_alt += len(group.get("surgical methods", []))
-                                total_alt += len(group.get("rehabilitation methods", []))
-                                total_alt += len(group.get("medicines", []))
-                            joint_groups = s.get("joint_groups", [])
-                            for group in joint_groups:
-                                total_joint += len(group.get("surgical methods", []))
-                                total_joint += len(group.get("rehabilitation methods", []))
-                                total_joint += len(group.get("medicines", []))
+                    variants_n, total_stages, total_alt, total_joint = planner.get_type_stats(type_obj)
+                    st.write(f"**Вариантов:** {variants_n}")
 
                     col1, col2, col3, col4 = st.columns(4)
                     with col1:
-                        st.metric("Вариантов", len(variants))
+                        st.metric("Вариантов", variants_n)
                     with col2:
                         st.metric("Этапов", total_stages)
                     with col3:
@@ -656,8 +882,7 @@ def main():
                         st.markdown(f"**{v['name']}**")
                         stages = v.get("stage", [])
                         for s in stages[:2]:
-                            alt_count = sum(len(group.get(k, [])) for group in s.get("alternative_groups", []) for k in ["surgical methods", "rehabilitation methods", "medicines"])
-                            joint_count = sum(len(group.get(k, [])) for group in s.get("joint_groups", []) for k in ["surgical methods", "rehabilitation methods", "medicines"])
+                            alt_count, joint_count = planner.get_stage_counts(s)
                             st.write(f"  - {s['name_stage']}: {alt_count} альт., {joint_count} совм.")
                     if len(variants) > 3:
                         st.write("  ...")